@@ -1,6 +1,10 @@
 import pgzrun
+import argparse
 import math
 import random
+import socket
+import struct
+import time
 from pygame import Rect 
 
 # Tela
@@ -72,8 +76,31 @@ ENEMY_PATROL_SPEED = 1.0
 ANIMATION_FRAME_DURATION = 0.1 #
 PLAYER_IDLE_ANIMATION_FRAME_DURATION = 0.1
 ENEMY_HALF_HEIGHT = 7 
+ENEMY_HALF_WIDTH = 7
 PLAYER_HURT_FRAME_DURATION = 0.3 
 
+# Perseguição dos inimigos
+ENEMY_CHASE_RANGE = 220 # Distância em que o slime começa a perseguir o jogador
+ENEMY_CHASE_SPEED = 2.0
+ENEMY_AIR_SPEED = 3.5 # Velocidade horizontal máxima durante um pulo/queda
+ENEMY_JUMP_STRENGTH = -13
+NAV_EDGE_MARGIN = 4 # Folga para pousar dentro da superfície de destino
+NAV_MAX_FLIGHT_FRAMES = 120
+
+# Co-op em rede (rollback)
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+SIMULATION_DT = 1 / 60 # Passo fixo para as duas máquinas simularem igual
+COOP_MAX_FRAMES_PER_UPDATE = 4 # Limite de frames recuperados num update lento
+ROLLBACK_MAX_FRAMES = 8 # Máximo de frames previstos antes de esperar o outro jogador
+ROLLBACK_FRAME_BUDGET = 0.016
+NET_MAX_INPUTS_PER_PACKET = 64
+COOP_BASE_PORT = 50007
+COOP_RANDOM_SEED = 2024
+COOP_WAIT_TIMEOUT = 10 # Segundos esperando o outro jogador antes de voltar ao menu
+PLAYER_TWO_START_X = 150
+
 # --- Classes ---
 
 class AnimatedActor:
@@ -136,6 +163,18 @@ class AnimatedActor:
     def reset_position(self, pos):
         self.actor.pos = pos
 
+    def save_state(self):
+        """Cópia do estado necessário para voltar a este frame (rollback)."""
+        return (self.actor.pos, self.actor.image, getattr(self.actor, "opacity", 1.0), self.current_action,
+                self.current_frame_index, self.animation_timer, self.facing_direction)
+
+    def load_state(self, state):
+        (pos, image, opacity, self.current_action,
+         self.current_frame_index, self.animation_timer, self.facing_direction) = state
+        self.actor.image = image
+        self.actor.pos = pos
+        self.actor.opacity = opacity
+
 
 class Player(AnimatedActor):
     """Classe para o jogador."""
@@ -154,6 +193,7 @@ class Player(AnimatedActor):
         self.is_moving_x = False
         self.invincibility_timer = 0 
         self.hurt_frame_display_timer = 0 
+        self.nav_surface = None
 
     def _set_standard_animation_action(self):
         """Define a ação de animação padrão baseada no estado do jogador."""
@@ -164,49 +204,47 @@ class Player(AnimatedActor):
         else:
             self.set_action("idle")
 
-    def update(self, dt, platforms_list):
+    def update(self, dt, platform_bounds, controls):
         if self.health <= 0:
             return
 
         # Movimento e colisão
         prev_x, prev_y = self.actor.pos
         self.is_moving_x = False
-        if keyboard.left:
+        if controls & INPUT_LEFT:
             self.actor.x -= PLAYER_SPEED
             self.facing_direction = -1
             self.is_moving_x = True
-        if keyboard.right:
+        if controls & INPUT_RIGHT:
             self.actor.x += PLAYER_SPEED
             self.facing_direction = 1
             self.is_moving_x = True
 
-        for plat in platforms_list:
-            if self.actor.colliderect(plat):
-                self.actor.x = prev_x 
-                break
+        if find_colliding_platform(self.actor, platform_bounds) is not None:
+            self.actor.x = prev_x 
 
         if not self.on_ground:
             self.velocity_y += GRAVITY
             self.actor.y += self.velocity_y
 
         self.on_ground = False 
-        for plat in platforms_list:
-            if self.actor.colliderect(plat):
-                if self.velocity_y > 0: 
-                    self.actor.bottom = plat.top
-                    self.on_ground = True
-                    self.is_jumping = False
-                    self.velocity_y = 0
-                elif self.velocity_y < 0: 
-                    self.actor.top = plat.bottom
-                    self.velocity_y = 0 
-                break
-
-        if keyboard.space and self.on_ground and not self.is_jumping:
+        plat_index = find_colliding_platform(self.actor, platform_bounds)
+        if plat_index is not None:
+            _, plat_top, _, plat_bottom = platform_bounds[plat_index]
+            if self.velocity_y > 0: 
+                self.actor.bottom = plat_top
+                self.on_ground = True
+                self.is_jumping = False
+                self.velocity_y = 0
+            elif self.velocity_y < 0: 
+                self.actor.top = plat_bottom
+                self.velocity_y = 0 
+
+        if controls & INPUT_JUMP and self.on_ground and not self.is_jumping:
             self.velocity_y = PLAYER_JUMP_STRENGTH
             self.on_ground = False
             self.is_jumping = True
-            if sounds_on: getattr(sounds, SOUND_JUMP_FILENAME).play()
+            play_sound(SOUND_JUMP_FILENAME)
         
         # Invencibilidade e cooldown
         if self.invincibility_timer > 0:
@@ -248,18 +286,15 @@ class Player(AnimatedActor):
 
 
     def take_damage(self, amount):
-        global game_state
         if self.invincibility_timer <= 0: 
             self.health -= amount
-            if sounds_on: getattr(sounds, SOUND_HURT_FILENAME).play()
+            play_sound(SOUND_HURT_FILENAME)
             
             self.invincibility_timer = 1.5 
             self.hurt_frame_display_timer = PLAYER_HURT_FRAME_DURATION 
 
             if self.health <= 0:
                 self.health = 0
-                game_state = GAME_STATE_GAME_OVER
-                if music_on: music.stop()
 
     def reset(self):
         super().reset_position(self.start_pos)
@@ -270,9 +305,19 @@ class Player(AnimatedActor):
         self.facing_direction = 1
         self.invincibility_timer = 0
         self.hurt_frame_display_timer = 0 
+        self.nav_surface = None
         self.actor.opacity = 1.0
         self.set_action("idle")
 
+    def save_state(self):
+        return (super().save_state(), self.velocity_y, self.on_ground, self.is_jumping, self.health,
+                self.is_moving_x, self.invincibility_timer, self.hurt_frame_display_timer, self.nav_surface)
+
+    def load_state(self, state):
+        (actor_state, self.velocity_y, self.on_ground, self.is_jumping, self.health,
+         self.is_moving_x, self.invincibility_timer, self.hurt_frame_display_timer, self.nav_surface) = state
+        super().load_state(actor_state)
+
 
 class Enemy(AnimatedActor):
     """Classe para os inimigos."""
@@ -300,12 +345,27 @@ class Enemy(AnimatedActor):
         self.is_active = True 
         self.set_action("walk") 
         self.pause_timer = 0 
+        self.is_chasing = False
+        self.on_ground = True
+        self.velocity_y = 0
+        self.air_velocity_x = 0
+        self.air_clear_top = None
+        self.nav_surface = None
 
-    def update(self, dt, platforms_list): 
+    def update(self, dt, platform_bounds, nav_graph=None, chase_target=None): 
         if not self.is_active:
             return
 
-        if self.pause_timer > 0:
+        if nav_graph and chase_target and not self.is_chasing:
+            target_x, target_y, _ = chase_target
+            if math.hypot(target_x - self.actor.x, target_y - self.actor.y) <= ENEMY_CHASE_RANGE:
+                self.is_chasing = True
+                self.pause_timer = 0
+                self.nav_surface = nav_graph.surface_at(self.actor)
+
+        if self.is_chasing:
+            self._update_chase(nav_graph, platform_bounds, chase_target)
+        elif self.pause_timer > 0:
             self.pause_timer -= dt
             self.set_action("idle") 
         else:
@@ -315,26 +375,119 @@ class Enemy(AnimatedActor):
             if self.facing_direction == 1 and self.actor.right >= self.patrol_max_x:
                 self.actor.right = self.patrol_max_x 
                 self.facing_direction = -1
-                self.pause_timer = random.uniform(0.5, 2.0) 
+                self.pause_timer = simulation_random.uniform(0.5, 2.0) 
             elif self.facing_direction == -1 and self.actor.left <= self.patrol_min_x:
                 self.actor.left = self.patrol_min_x 
                 self.facing_direction = 1
-                self.pause_timer = random.uniform(0.5, 2.0)
+                self.pause_timer = simulation_random.uniform(0.5, 2.0)
 
         super().update_animation(dt) 
 
+    def _update_chase(self, nav_graph, platform_bounds, chase_target):
+        """Persegue o alvo seguindo o próximo link do caminho pré-calculado."""
+        if not self.on_ground:
+            self._update_airborne(nav_graph, platform_bounds)
+            return
+
+        if self.nav_surface is None:
+            self.nav_surface = nav_graph.surface_at(self.actor)
+            if self.nav_surface is None:
+                self.on_ground = False
+                self.air_velocity_x = 0
+                self.air_clear_top = None
+                return
+
+        if chase_target is None:
+            self.set_action("idle")
+            return
+
+        surface = nav_graph.surfaces[self.nav_surface]
+        target_x, _, target_surface = chase_target
+        link = None
+        if target_surface is not None and target_surface != self.nav_surface:
+            link = nav_graph.next_link(self.nav_surface, target_surface)
+
+        if link:
+            goal_x = link.takeoff_x
+        else:
+            # Sem caminho (ou já na mesma superfície): aproxima-se sem cair da borda
+            goal_x = min(max(target_x, surface.left + ENEMY_HALF_WIDTH), surface.right - ENEMY_HALF_WIDTH)
+
+        distance_x = goal_x - self.actor.x
+        if abs(distance_x) <= ENEMY_CHASE_SPEED:
+            self.actor.x = goal_x
+            if link:
+                self._launch(link)
+            else:
+                self.set_action("idle")
+            return
+
+        self.facing_direction = 1 if distance_x > 0 else -1
+        self.actor.x += ENEMY_CHASE_SPEED * self.facing_direction
+        self.set_action("walk")
+
+        if self.actor.left >= surface.right or self.actor.right <= surface.left:
+            self.on_ground = False
+            self.velocity_y = 0
+            self.air_velocity_x = ENEMY_CHASE_SPEED * self.facing_direction
+            self.air_clear_top = None
+
+    def _launch(self, link):
+        """Inicia o pulo ou a queda descritos pelo link."""
+        self.on_ground = False
+        self.velocity_y = link.launch_velocity
+        self.air_velocity_x = link.air_velocity_x
+        self.air_clear_top = link.clear_top
+        if link.air_velocity_x:
+            self.facing_direction = 1 if link.air_velocity_x > 0 else -1
+        self.set_action("walk")
+
+    def _update_airborne(self, nav_graph, platform_bounds):
+        prev_x = self.actor.x
+        if self.air_clear_top is None or self.actor.bottom <= self.air_clear_top:
+            self.actor.x += self.air_velocity_x
+        if find_colliding_platform(self.actor, platform_bounds) is not None:
+            self.actor.x = prev_x
+
+        self.velocity_y += GRAVITY
+        self.actor.y += self.velocity_y
+        plat_index = find_colliding_platform(self.actor, platform_bounds)
+        if plat_index is not None:
+            _, plat_top, _, plat_bottom = platform_bounds[plat_index]
+            if self.velocity_y > 0:
+                self.actor.bottom = plat_top
+                self.on_ground = True
+                self.velocity_y = 0
+                self.air_velocity_x = 0
+                self.air_clear_top = None
+                self.nav_surface = nav_graph.platform_surfaces[plat_index]
+            elif self.velocity_y < 0:
+                self.actor.top = plat_bottom
+                self.velocity_y = 0
+
+        if self.actor.left < 0: self.actor.left = 0
+        if self.actor.right > WIDTH: self.actor.right = WIDTH
+        if self.actor.top > HEIGHT:
+            self.reset()
+
 
     def defeat(self):
         self.is_active = False
         self.actor.opacity = 0 
-        if sounds_on: getattr(sounds, SOUND_ENEMY_DEFEAT_FILENAME).play()
+        play_sound(SOUND_ENEMY_DEFEAT_FILENAME)
 
 
     def reset(self):
         super().reset_position(self.start_pos)
         self.is_active = True
-        self.facing_direction = random.choice([-1, 1]) 
+        self.facing_direction = simulation_random.choice([-1, 1]) 
         self.pause_timer = 0
+        self.is_chasing = False
+        self.on_ground = True
+        self.velocity_y = 0
+        self.air_velocity_x = 0
+        self.air_clear_top = None
+        self.nav_surface = None
         self.actor.opacity = 1.0
         if self.actor.left < self.patrol_min_x:
             self.actor.left = self.patrol_min_x
@@ -342,12 +495,457 @@ class Enemy(AnimatedActor):
             self.actor.right = self.patrol_max_x
         self.set_action("walk")
 
+    def save_state(self):
+        return (super().save_state(), self.is_active, self.pause_timer, self.is_chasing, self.on_ground,
+                self.velocity_y, self.air_velocity_x, self.air_clear_top, self.nav_surface)
+
+    def load_state(self, state):
+        (actor_state, self.is_active, self.pause_timer, self.is_chasing, self.on_ground,
+         self.velocity_y, self.air_velocity_x, self.air_clear_top, self.nav_surface) = state
+        super().load_state(actor_state)
+
+
+# --- Navegação dos Inimigos ---
+
+class NavigationSurface:
+    """Trecho contínuo de topo de plataforma onde um inimigo pode andar."""
+    def __init__(self, left, right, top):
+        self.left = left
+        self.right = right
+        self.top = top
+
+
+class NavigationLink:
+    """Pulo ou queda viável de uma superfície para outra."""
+    def __init__(self, source, target, takeoff_x, launch_velocity, air_velocity_x, clear_top, cost):
+        self.source = source
+        self.target = target
+        self.takeoff_x = takeoff_x
+        self.launch_velocity = launch_velocity
+        self.air_velocity_x = air_velocity_x
+        self.clear_top = clear_top # Só anda na horizontal depois de passar desta altura
+        self.cost = cost
+
+
+class NavigationGraph:
+    """Grafo de superfícies e pulos/quedas, com caminhos mínimos pré-calculados por fase."""
+    def __init__(self, platforms_list):
+        self.surfaces = []
+        self.platform_surfaces = []
+        self.links = []
+        self._build_surfaces(platforms_list)
+        self._build_links()
+        self._build_paths()
+
+    def _build_surfaces(self, platforms_list):
+        # Blocos vizinhos na mesma altura formam uma única superfície
+        self.platform_surfaces = [None] * len(platforms_list)
+        order = sorted(range(len(platforms_list)), key=lambda i: (platforms_list[i].top, platforms_list[i].left))
+        current = None
+        for index in order:
+            plat = platforms_list[index]
+            if current is None or plat.top != current.top or plat.left > current.right:
+                current = NavigationSurface(plat.left, plat.right, plat.top)
+                self.surfaces.append(current)
+            else:
+                current.right = max(current.right, plat.right)
+            self.platform_surfaces[index] = len(self.surfaces) - 1
+
+        for surface in self.surfaces:
+            surface.left = max(surface.left, 0)
+            surface.right = min(surface.right, WIDTH)
+
+    def _build_links(self):
+        for source_index, source in enumerate(self.surfaces):
+            for target_index, target in enumerate(self.surfaces):
+                if source_index == target_index:
+                    continue
+                best_link = None
+                for takeoff_x, landing_x, launch_velocity, wait_to_clear in self._link_candidates(source, target):
+                    flight = flight_frames(target.top - source.top, launch_velocity)
+                    if flight is None:
+                        continue
+                    frames, frames_above = flight
+                    moving_frames = frames_above if wait_to_clear else frames
+                    if abs(landing_x - takeoff_x) > ENEMY_AIR_SPEED * moving_frames:
+                        continue
+                    walk_frames = abs(takeoff_x - (source.left + source.right) / 2) / ENEMY_CHASE_SPEED
+                    cost = frames + walk_frames
+                    if best_link is None or cost < best_link.cost:
+                        best_link = NavigationLink(source_index, target_index, takeoff_x, launch_velocity,
+                                                   (landing_x - takeoff_x) / moving_frames,
+                                                   target.top if wait_to_clear else None, cost)
+                if best_link:
+                    self.links.append(best_link)
+
+    def _link_candidates(self, source, target):
+        """Saída (x), pouso (x), velocidade inicial e se deve subir antes de avançar."""
+        candidates = []
+        fall_allowed = target.top > source.top
+        if target.left >= source.right:
+            landing_x = target.left + ENEMY_HALF_WIDTH + NAV_EDGE_MARGIN
+            candidates.append((source.right - ENEMY_HALF_WIDTH, landing_x, ENEMY_JUMP_STRENGTH, False))
+            if fall_allowed:
+                candidates.append((source.right + ENEMY_HALF_WIDTH + 1, landing_x, 0, False))
+        elif target.right <= source.left:
+            landing_x = target.right - ENEMY_HALF_WIDTH - NAV_EDGE_MARGIN
+            candidates.append((source.left + ENEMY_HALF_WIDTH, landing_x, ENEMY_JUMP_STRENGTH, False))
+            if fall_allowed:
+                candidates.append((source.left - ENEMY_HALF_WIDTH - 1, landing_x, 0, False))
+        elif target.top < source.top:
+            # Plataforma acima: pula ao lado dela e entra por cima
+            takeoff_x = target.left - ENEMY_HALF_WIDTH - NAV_EDGE_MARGIN
+            if takeoff_x >= source.left:
+                candidates.append((takeoff_x, target.left + ENEMY_HALF_WIDTH + NAV_EDGE_MARGIN, ENEMY_JUMP_STRENGTH, True))
+            takeoff_x = target.right + ENEMY_HALF_WIDTH + NAV_EDGE_MARGIN
+            if takeoff_x <= source.right:
+                candidates.append((takeoff_x, target.right - ENEMY_HALF_WIDTH - NAV_EDGE_MARGIN, ENEMY_JUMP_STRENGTH, True))
+        elif fall_allowed:
+            # Plataforma abaixo: cai por uma das bordas que ficam sobre ela
+            takeoff_x = source.left - ENEMY_HALF_WIDTH - 1
+            if takeoff_x - NAV_EDGE_MARGIN >= target.left + ENEMY_HALF_WIDTH:
+                candidates.append((takeoff_x, takeoff_x - NAV_EDGE_MARGIN, 0, False))
+            takeoff_x = source.right + ENEMY_HALF_WIDTH + 1
+            if takeoff_x + NAV_EDGE_MARGIN <= target.right - ENEMY_HALF_WIDTH:
+                candidates.append((takeoff_x, takeoff_x + NAV_EDGE_MARGIN, 0, False))
+        return candidates
+
+    def _build_paths(self):
+        # Floyd-Warshall: guarda apenas o primeiro link de cada caminho mínimo
+        count = len(self.surfaces)
+        self.path_costs = [[math.inf] * count for _ in range(count)]
+        self.next_links = [[None] * count for _ in range(count)]
+        for index in range(count):
+            self.path_costs[index][index] = 0
+        for link in self.links:
+            if link.cost < self.path_costs[link.source][link.target]:
+                self.path_costs[link.source][link.target] = link.cost
+                self.next_links[link.source][link.target] = link
+
+        for middle in range(count):
+            costs_to_middle = [row[middle] for row in self.path_costs]
+            costs_from_middle = self.path_costs[middle]
+            for source in range(count):
+                cost_to_middle = costs_to_middle[source]
+                if cost_to_middle == math.inf:
+                    continue
+                source_costs = self.path_costs[source]
+                source_links = self.next_links[source]
+                first_link = source_links[middle]
+                for target in range(count):
+                    new_cost = cost_to_middle + costs_from_middle[target]
+                    if new_cost < source_costs[target]:
+                        source_costs[target] = new_cost
+                        source_links[target] = first_link
+
+    def next_link(self, source, target):
+        """Próximo pulo/queda no caminho mínimo entre duas superfícies (ou None)."""
+        return self.next_links[source][target]
+
+    def surface_at(self, actor):
+        """Índice da superfície onde o ator está apoiado (ou None)."""
+        for index, surface in enumerate(self.surfaces):
+            if abs(actor.bottom - surface.top) <= 1 and actor.right > surface.left and actor.left < surface.right:
+                return index
+        return None
+
+
+def flight_frames(drop, launch_velocity):
+    """Frames no ar até pousar numa superfície 'drop' pixels abaixo (negativo = acima).
+
+    Retorna (frames totais, frames já acima da superfície) ou None se não alcança.
+    """
+    y = 0
+    highest_y = 0
+    frames_above = 0
+    velocity_y = launch_velocity
+    for frame in range(1, NAV_MAX_FLIGHT_FRAMES + 1):
+        if y <= drop:
+            frames_above += 1
+        velocity_y += GRAVITY
+        y += velocity_y
+        if velocity_y > 0 and y >= drop:
+            return (frame, frames_above) if highest_y < drop else None
+        highest_y = min(highest_y, y)
+    return None
+
+
+# --- Co-op em Rede (Rollback) ---
+
+# Cabeçalho do pacote: tipo, rodada, último frame confirmado do outro jogador, primeiro frame e quantidade de comandos
+NET_PACKET_HEADER = struct.Struct("!BBiIB")
+NET_PACKET_INPUTS = 0
+NET_PACKET_JOIN = 1 # Pedido para começar a rodada
+NET_PACKET_ABORT = 2 # Saída da rodada antes do resultado confirmado
+
+# Fases da sessão
+COOP_PHASE_IDLE = "idle"
+COOP_PHASE_JOINING = "joining"
+COOP_PHASE_PLAYING = "playing"
+
+
+def round_is_newer(round_id, other_round_id):
+    """Compara números de rodada que dão a volta em 256."""
+    return 0 < (round_id - other_round_id) % 256 < 128
+
+
+class RollbackSession:
+    """Co-op de dois jogadores sobre UDP com predição dos comandos remotos e rollback."""
+    def __init__(self, local_player_index, local_port, remote_host, remote_port, latency=0.0, loss=0.0):
+        self.local_player_index = local_player_index
+        self.remote_player_index = 1 - local_player_index
+        self.remote_address = (remote_host, remote_port)
+        self.simulated_latency = latency
+        self.simulated_loss = loss
+        self.network_random = random.Random()
+        self.outgoing_packets = []
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("", local_port))
+        self.socket.setblocking(False)
+        self.phase = COOP_PHASE_IDLE
+        self.round_id = 0
+        self.left_round_id = None
+        self.farewell_packet = None # Resposta a pacotes atrasados da rodada que deixamos
+        self.remote_left = False
+        self._reset_round()
+
+    def _reset_round(self):
+        self.current_frame = 0
+        self.local_inputs = {}
+        self.remote_inputs = {}
+        self.predicted_remote_inputs = {}
+        self.confirmed_remote_frame = -1
+        self.remote_ack_frame = -1
+        self.rollback_frame = None
+        self.end_frame = None # Frame em que a partida terminou (None enquanto continua)
+        self.snapshots = [None] * (ROLLBACK_MAX_FRAMES + 2)
+        self.is_waiting = False
+        self.frame_time_accumulator = 0
+        self.last_remote_progress = time.monotonic()
+
+    def join_round(self):
+        """Pede uma nova rodada; ela só começa quando o outro jogador responder com a mesma rodada."""
+        self.round_id = (self.round_id + 1) % 256
+        self.phase = COOP_PHASE_JOINING
+        self.remote_left = False
+        self._reset_round()
+
+    def leave_round(self, result_confirmed):
+        """Sai da rodada atual avisando o outro jogador."""
+        if self.phase == COOP_PHASE_IDLE:
+            return
+        if result_confirmed:
+            self.farewell_packet = self._inputs_packet()
+        else:
+            self.farewell_packet = NET_PACKET_HEADER.pack(NET_PACKET_ABORT, self.round_id, self.confirmed_remote_frame, 0, 0)
+        self.left_round_id = self.round_id
+        self.phase = COOP_PHASE_IDLE
+        self._send_packet(self.farewell_packet)
+
+    def advance(self, dt, local_controls):
+        """Avança os frames de SIMULATION_DT que couberem em dt, refazendo antes os frames previstos errado."""
+        self.poll()
+        if self.phase != COOP_PHASE_PLAYING:
+            # Segura no frame 0 até o outro jogador entrar na mesma rodada
+            self.is_waiting = True
+            self.frame_time_accumulator = 0
+            if self.phase == COOP_PHASE_JOINING:
+                self._send_packet(NET_PACKET_HEADER.pack(NET_PACKET_JOIN, self.round_id, -1, 0, 0))
+            return
+
+        if self.rollback_frame is not None:
+            self._rollback()
+
+        self.frame_time_accumulator = min(self.frame_time_accumulator + dt,
+                                          SIMULATION_DT * COOP_MAX_FRAMES_PER_UPDATE)
+        while True:
+            # Não prevê mais que ROLLBACK_MAX_FRAMES à frente do último comando confirmado
+            self.is_waiting = self.current_frame - self.confirmed_remote_frame > ROLLBACK_MAX_FRAMES
+            if self.is_waiting or game_state != GAME_STATE_PLAYING:
+                self.frame_time_accumulator = 0 # Não acelera depois de uma espera
+                break
+            if self.frame_time_accumulator < SIMULATION_DT:
+                break
+            self.frame_time_accumulator -= SIMULATION_DT
+            self.local_inputs[self.current_frame] = local_controls
+            self._simulate(self.current_frame)
+            if game_state != GAME_STATE_PLAYING:
+                self.end_frame = self.current_frame
+            self.current_frame += 1
+
+        self.send_inputs()
+        self._prune()
+
+    def _last_relevant_frame(self):
+        return self.end_frame if self.end_frame is not None else self.current_frame - 1
+
+    def wait_timed_out(self):
+        """Se faltam comandos do outro jogador e nenhum chega há mais de COOP_WAIT_TIMEOUT segundos."""
+        return self.phase == COOP_PHASE_PLAYING and self.confirmed_remote_frame < self._last_relevant_frame() and \
+               time.monotonic() - self.last_remote_progress > COOP_WAIT_TIMEOUT
+
+    def is_result_confirmed(self):
+        """Se todos os frames até o resultado atual já usam comandos reais do outro jogador."""
+        last_frame = self._last_relevant_frame()
+        rollback_pending = self.rollback_frame is not None and self.rollback_frame <= last_frame
+        return self.confirmed_remote_frame >= last_frame and not rollback_pending
+
+    def _simulate(self, frame):
+        self.snapshots[frame % len(self.snapshots)] = (frame, save_simulation_state())
+        simulate_frame(SIMULATION_DT, self._frame_controls(frame))
+
+    def _frame_controls(self, frame):
+        remote_controls = self.remote_inputs.get(frame)
+        if remote_controls is None:
+            # Predição: o outro jogador repete o último comando confirmado
+            remote_controls = self.remote_inputs.get(self.confirmed_remote_frame, 0)
+        self.predicted_remote_inputs[frame] = remote_controls
+
+        frame_controls = [0, 0]
+        frame_controls[self.local_player_index] = self.local_inputs[frame]
+        frame_controls[self.remote_player_index] = remote_controls
+        return frame_controls
+
+    def _rollback(self):
+        global is_resimulating
+        frame = self.rollback_frame
+        self.rollback_frame = None
+        if self.end_frame is not None and frame > self.end_frame:
+            return # Comandos depois do fim não mudam o resultado
+        snapshot = self.snapshots[frame % len(self.snapshots)]
+        if snapshot is None or snapshot[0] != frame:
+            print(f"Aviso: snapshot do frame {frame} não está mais disponível para o rollback.")
+            return
+
+        started = time.perf_counter()
+        load_simulation_state(snapshot[1])
+        self.end_frame = None
+        is_resimulating = True
+        try:
+            # current_frame não volta: os comandos locais dos frames seguintes já foram enviados
+            for resimulated_frame in range(frame, self.current_frame):
+                self._simulate(resimulated_frame)
+                if game_state != GAME_STATE_PLAYING:
+                    self.end_frame = resimulated_frame
+                    break
+        finally:
+            is_resimulating = False
+
+        elapsed = time.perf_counter() - started
+        if elapsed > ROLLBACK_FRAME_BUDGET:
+            print(f"Aviso: rollback de {self.current_frame - frame} frames levou {elapsed * 1000:.1f} ms.")
+
+    def poll(self):
+        """Lê todos os pacotes recebidos sem bloquear."""
+        while True:
+            try:
+                data, _ = self.socket.recvfrom(1024)
+            except BlockingIOError:
+                break
+            except ConnectionResetError: # Windows: o outro processo ainda não abriu a porta
+                continue
+
+            if len(data) < NET_PACKET_HEADER.size:
+                continue
+            kind, round_id, ack_frame, first_frame, count = NET_PACKET_HEADER.unpack_from(data)
+
+            if self.phase == COOP_PHASE_JOINING and kind != NET_PACKET_ABORT and round_id != self.left_round_id:
+                # Os dois jogadores ficam com a maior rodada pedida
+                if round_is_newer(round_id, self.round_id):
+                    self.round_id = round_id
+                if round_id == self.round_id:
+                    self.phase = COOP_PHASE_PLAYING
+                    self.last_remote_progress = time.monotonic()
+
+            if self.phase == COOP_PHASE_PLAYING and round_id == self.round_id:
+                if kind == NET_PACKET_ABORT:
+                    self.remote_left = True
+                elif kind == NET_PACKET_INPUTS:
+                    self.remote_ack_frame = max(self.remote_ack_frame, ack_frame)
+                    for offset, controls in enumerate(data[NET_PACKET_HEADER.size:NET_PACKET_HEADER.size + count]):
+                        self._receive_remote_input(first_frame + offset, controls)
+            elif round_id == self.left_round_id and kind != NET_PACKET_ABORT and self.farewell_packet:
+                self._send_packet(self.farewell_packet)
+
+        self._flush_outgoing()
+
+    def _receive_remote_input(self, frame, controls):
+        if frame <= self.confirmed_remote_frame or frame in self.remote_inputs:
+            return
+        self.remote_inputs[frame] = controls
+        if frame < self.current_frame and self.predicted_remote_inputs.get(frame) != controls:
+            if self.rollback_frame is None or frame < self.rollback_frame:
+                self.rollback_frame = frame
+        while self.confirmed_remote_frame + 1 in self.remote_inputs:
+            self.confirmed_remote_frame += 1
+            self.last_remote_progress = time.monotonic()
+
+    def send_inputs(self):
+        """Reenvia todos os comandos locais que o outro jogador ainda não confirmou."""
+        self._send_packet(self._inputs_packet())
+
+    def _inputs_packet(self):
+        first_frame = self.remote_ack_frame + 1
+        last_frame = min(self.current_frame, first_frame + NET_MAX_INPUTS_PER_PACKET)
+        inputs = bytes(self.local_inputs[frame] for frame in range(first_frame, last_frame))
+        return NET_PACKET_HEADER.pack(NET_PACKET_INPUTS, self.round_id, self.confirmed_remote_frame,
+                                      first_frame, len(inputs)) + inputs
+
+    def _send_packet(self, packet):
+        if self.network_random.random() >= self.simulated_loss:
+            self.outgoing_packets.append((time.monotonic() + self.simulated_latency, packet))
+        self._flush_outgoing()
+
+    def _flush_outgoing(self):
+        now = time.monotonic()
+        while self.outgoing_packets and self.outgoing_packets[0][0] <= now:
+            _, packet = self.outgoing_packets.pop(0)
+            try:
+                self.socket.sendto(packet, self.remote_address)
+            except OSError as e:
+                print(f"Aviso: falha ao enviar pacote do co-op: {e}")
+
+    def _prune(self):
+        # Comandos locais ainda podem ser necessários para reenvio ou para um rollback
+        oldest_local_frame = min(self.remote_ack_frame, self.confirmed_remote_frame)
+        for frame in [f for f in self.local_inputs if f <= oldest_local_frame]:
+            del self.local_inputs[frame]
+        for frame in [f for f in self.remote_inputs if f < self.confirmed_remote_frame]:
+            del self.remote_inputs[frame]
+        for frame in [f for f in self.predicted_remote_inputs if f <= self.confirmed_remote_frame]:
+            del self.predicted_remote_inputs[frame]
+
+
+def create_coop_session_from_args():
+    """Cria a sessão de co-op a partir da linha de comando (ou None no modo de um jogador)."""
+    parser = argparse.ArgumentParser(description=TITLE)
+    parser.add_argument("--coop", type=int, choices=[1, 2], help="Número deste jogador no co-op em rede")
+    parser.add_argument("--port", type=int, help="Porta UDP local")
+    parser.add_argument("--remote-host", default="127.0.0.1", help="Endereço do outro jogador")
+    parser.add_argument("--remote-port", type=int, help="Porta UDP do outro jogador")
+    parser.add_argument("--latency", type=float, default=0, help="Latência simulada em ms (por envio)")
+    parser.add_argument("--loss", type=float, default=0, help="Perda de pacotes simulada em %%")
+    args, _ = parser.parse_known_args()
+    if not args.coop:
+        return None
+
+    local_port = args.port if args.port else COOP_BASE_PORT + args.coop - 1
+    remote_port = args.remote_port if args.remote_port else COOP_BASE_PORT + 2 - args.coop
+    return RollbackSession(args.coop - 1, local_port, args.remote_host, remote_port,
+                           args.latency / 1000, args.loss / 100)
+
 
 # --- Variáveis Globais do Jogo ---
-player_entity = None
+player_entity = None # Jogador controlado nesta máquina
+list_of_players = []
 list_of_platforms = []
+list_of_platform_bounds = [] # (left, top, right, bottom) de cada plataforma, para colisões rápidas
 list_of_enemies = []
+level_nav_graph = None
 background_play_actor = None
+simulation_random = random.Random() # Aleatoriedade da simulação (reproduzível no co-op)
+coop_session = None
+is_resimulating = False
 
 # Botões do Menu
 BUTTON_WIDTH = 220
@@ -394,10 +992,22 @@ def create_platform(x, y, image_name=PLATFORM_IMAGE, width_tiles=1, height_tiles
         return Rect(x - 32, y - 16, 64 * width_tiles, 32 * height_tiles)
 
 
+def find_colliding_platform(actor, platform_bounds):
+    """Índice da primeira plataforma que colide com o ator (ou None)."""
+    left, top = actor.left, actor.top
+    right, bottom = left + actor.width, top + actor.height
+    for index, (plat_left, plat_top, plat_right, plat_bottom) in enumerate(platform_bounds):
+        if left < plat_right and top < plat_bottom and right > plat_left and bottom > plat_top:
+            return index
+    return None
+
+
 def setup_level_one():
-    global player_entity, list_of_platforms, list_of_enemies, background_play_actor
+    global player_entity, list_of_platforms, list_of_enemies, background_play_actor, level_nav_graph
+    list_of_players.clear()
     list_of_platforms.clear()
     list_of_enemies.clear()
+    simulation_random.seed(COOP_RANDOM_SEED if coop_session else None)
 
     try:
         background_play_actor = Actor(BACKGROUND_IMAGE_PLAY)
@@ -405,7 +1015,12 @@ def setup_level_one():
     except Exception:
         background_play_actor = None 
 
-    player_entity = Player(100, HEIGHT - 100)
+    list_of_players.append(Player(100, HEIGHT - 100))
+    if coop_session:
+        list_of_players.append(Player(PLAYER_TWO_START_X, HEIGHT - 100))
+        player_entity = list_of_players[coop_session.local_player_index]
+    else:
+        player_entity = list_of_players[0]
 
     all_ground_blocks = []
     platform_ground_y = HEIGHT - 20 + 16 
@@ -462,20 +1077,44 @@ def setup_level_one():
     enemy5_y = platform_for_enemy5.top - ENEMY_HALF_HEIGHT
     list_of_enemies.append(Enemy(enemy5_x, enemy5_y, platform_for_enemy5.left, platform_for_enemy5.right))
 
+    list_of_platform_bounds[:] = [(plat.left, plat.top, plat.right, plat.bottom) for plat in list_of_platforms]
+    level_nav_graph = NavigationGraph(list_of_platforms)
+
 
 def start_new_game():
     global game_state
     setup_level_one() 
-    if player_entity: player_entity.reset()
+    for player in list_of_players:
+        player.reset()
+    if coop_session: coop_session.join_round()
     game_state = GAME_STATE_PLAYING
-    
-    if music_on:
+    update_music_for_game_state()
+
+def play_sound(sound_name):
+    # Frames refeitos no rollback não repetem os sons
+    if sounds_on and not is_resimulating:
+        getattr(sounds, sound_name).play()
+
+def update_music_for_game_state():
+    if not music_on:
+        return
+    if game_state == GAME_STATE_PLAYING:
         try:
-            music.stop() 
+            music.stop()
             music.play(MUSIC_BACKGROUND)
             music.set_volume(0.3)
         except Exception as e:
             print(f"Erro ao tocar música de fundo '{MUSIC_BACKGROUND}': {e}")
+    elif game_state == GAME_STATE_GAME_OVER:
+        music.stop()
+    elif game_state == GAME_STATE_VICTORY:
+        music.stop()
+        try:
+            if MUSIC_VICTORY_FILENAME: 
+                music.play(MUSIC_VICTORY_FILENAME)
+                music.set_volume(0.4)
+        except Exception as e:
+            print(f"Erro ao tocar música de vitória '{MUSIC_VICTORY_FILENAME}': {e}")
 
 def manage_music_and_sounds():
     global music_on, sounds_on
@@ -505,6 +1144,71 @@ def manage_music_and_sounds():
                 except Exception as e:
                     print(f"Erro ao tentar tocar '{current_music_to_play}' ao ligar sons: {e}")
 
+def read_local_controls():
+    controls = 0
+    if keyboard.left: controls |= INPUT_LEFT
+    if keyboard.right: controls |= INPUT_RIGHT
+    if keyboard.space: controls |= INPUT_JUMP
+    return controls
+
+def simulate_frame(dt, frame_controls):
+    """Avança a fase em um frame usando os comandos de cada jogador."""
+    global game_state
+    for player, controls in zip(list_of_players, frame_controls):
+        player.update(dt, list_of_platform_bounds, controls)
+
+        if player.health > 0 and player.invincibility_timer <= 0:
+            for enemy in list_of_enemies:
+                if enemy.is_active and player.actor.colliderect(enemy.actor):
+                    if player.velocity_y > 0 and \
+                       player.actor.bottom < enemy.actor.centery + 10: 
+                        enemy.defeat()
+                        player.velocity_y = PLAYER_JUMP_STRENGTH * 0.6 
+                        play_sound(SOUND_ENEMY_DEFEAT_FILENAME)
+                        
+                        all_enemies_defeated = True
+                        for e_check in list_of_enemies:
+                            if e_check.is_active:
+                                all_enemies_defeated = False
+                                break
+                        if all_enemies_defeated:
+                            game_state = GAME_STATE_VICTORY
+                            return 
+                    else: 
+                        player.take_damage(1)
+                    break 
+
+    if all(player.health <= 0 for player in list_of_players):
+        game_state = GAME_STATE_GAME_OVER
+        return
+
+    chase_targets = []
+    for player in list_of_players:
+        if player.health > 0 and level_nav_graph:
+            if player.on_ground:
+                player.nav_surface = level_nav_graph.surface_at(player.actor)
+            chase_targets.append((player.actor.x, player.actor.y, player.nav_surface))
+
+    for enemy in list_of_enemies:
+        if enemy.is_active:
+            chase_target = None
+            if chase_targets:
+                chase_target = min(chase_targets, key=lambda target: abs(target[0] - enemy.actor.x) + abs(target[1] - enemy.actor.y))
+            enemy.update(dt, list_of_platform_bounds, level_nav_graph, chase_target)
+
+def save_simulation_state():
+    return (game_state, [player.save_state() for player in list_of_players],
+            [enemy.save_state() for enemy in list_of_enemies], simulation_random.getstate())
+
+def load_simulation_state(state):
+    global game_state
+    game_state, players_state, enemies_state, random_state = state
+    for player, player_state in zip(list_of_players, players_state):
+        player.load_state(player_state)
+    for enemy, enemy_state in zip(list_of_enemies, enemies_state):
+        enemy.load_state(enemy_state)
+    simulation_random.setstate(random_state)
+
 # --- Funções de Desenho (draw) ---
 
 def draw_menu_ui():
@@ -536,8 +1240,18 @@ def draw_playing_state():
         else: 
             screen.draw.filled_rect(plat, COLOR_PLATFORM)
 
-    if player_entity:
-        player_entity.draw()
+    for player in list_of_players:
+        if player.health > 0:
+            player.draw()
+
+    if coop_session:
+        for index, player in enumerate(list_of_players):
+            screen.draw.text(f"Vida J{index + 1}: {player.health}", (20, 20 + index * 40), fontsize=30, color="white", background="purple", owidth=0.5, ocolor="gray")
+        if coop_session.is_waiting:
+            waiting_text = "Aguardando o outro jogador entrar..." if coop_session.phase == COOP_PHASE_JOINING else "Aguardando o outro jogador..."
+            screen.draw.text(waiting_text, center=(WIDTH // 2, HEIGHT // 4), fontsize=30, color=COLOR_TEXT, owidth=1, ocolor="black")
+            screen.draw.text("ESC: Voltar ao Menu", center=(WIDTH // 2, HEIGHT // 4 + 35), fontsize=24, color=COLOR_TEXT, owidth=1, ocolor="black")
+    elif player_entity:
         screen.draw.text(f"Vida: {player_entity.health}", (20, 20), fontsize=30, color="white", background="purple", owidth=0.5, ocolor="gray")
 
     for enemy in list_of_enemies:
@@ -588,48 +1302,46 @@ def draw():
     elif game_state == GAME_STATE_CONTROLS: 
         draw_controls_menu()
 
+    match_ended = game_state == GAME_STATE_GAME_OVER or game_state == GAME_STATE_VICTORY
+    if coop_session and match_ended and not (coop_session.is_result_confirmed() or coop_session.wait_timed_out() or coop_session.remote_left):
+        screen.draw.text("Confirmando resultado com o outro jogador...", center=(WIDTH // 2, HEIGHT - 60), fontsize=26, color=COLOR_TEXT)
+
 
 def update(dt):
     global game_state
-    if game_state == GAME_STATE_PLAYING:
-        if player_entity:
-            player_entity.update(dt, list_of_platforms)
-
-            if player_entity.health > 0 and player_entity.invincibility_timer <= 0:
-                for enemy in list_of_enemies:
-                    if enemy.is_active and player_entity.actor.colliderect(enemy.actor):
-                        if player_entity.velocity_y > 0 and \
-                           player_entity.actor.bottom < enemy.actor.centery + 10: 
-                            enemy.defeat()
-                            player_entity.velocity_y = PLAYER_JUMP_STRENGTH * 0.6 
-                            if sounds_on: getattr(sounds, SOUND_ENEMY_DEFEAT_FILENAME).play()
-                            
-                            all_enemies_defeated = True
-                            for e_check in list_of_enemies:
-                                if e_check.is_active:
-                                    all_enemies_defeated = False
-                                    break
-                            if all_enemies_defeated:
-                                game_state = GAME_STATE_VICTORY
-                                if music_on:
-                                    music.stop()
-                                    try:
-                                        if MUSIC_VICTORY_FILENAME: 
-                                            music.play(MUSIC_VICTORY_FILENAME)
-                                            music.set_volume(0.4)
-                                    except Exception as e:
-                                        print(f"Erro ao tocar música de vitória '{MUSIC_VICTORY_FILENAME}': {e}")
-                                return 
-                        else: 
-                            player_entity.take_damage(1)
-                        break 
-
-        for enemy in list_of_enemies:
-            if enemy.is_active:
-                enemy.update(dt, list_of_platforms)
-
-    elif game_state == GAME_STATE_GAME_OVER or game_state == GAME_STATE_VICTORY:
-        if keyboard.RETURN or keyboard.KP_ENTER:
+    match_ended = game_state == GAME_STATE_GAME_OVER or game_state == GAME_STATE_VICTORY
+    if game_state == GAME_STATE_PLAYING or (coop_session and match_ended):
+        # No co-op o fim da partida ainda pode ser desfeito por um comando atrasado
+        previous_state = game_state
+        if coop_session:
+            coop_session.advance(dt, read_local_controls())
+        else:
+            simulate_frame(dt, [read_local_controls()])
+        if game_state != previous_state:
+            update_music_for_game_state()
+        if game_state == GAME_STATE_PLAYING:
+            if coop_session and (coop_session.remote_left or (coop_session.is_waiting and (keyboard.escape or coop_session.wait_timed_out()))):
+                # O outro jogador saiu, desconectou ou este jogador desistiu de esperar
+                print("Aviso: partida em rede encerrada antes do fim. Voltando ao menu.")
+                coop_session.leave_round(False)
+                game_state = GAME_STATE_MENU
+                if music_on:
+                    try:
+                        music.stop()
+                        music.play(MUSIC_MENU); music.set_volume(0.3)
+                    except Exception as e:
+                        print(f"Erro ao tocar música do menu (do co-op): {e}")
+            return
+    elif coop_session:
+        # Só responde a pacotes atrasados da rodada que ficou para trás
+        coop_session.poll()
+
+    if game_state == GAME_STATE_GAME_OVER or game_state == GAME_STATE_VICTORY:
+        # No co-op só sai depois que o resultado não pode mais ser desfeito (ou o outro jogador sumiu)
+        can_leave = not coop_session or coop_session.is_result_confirmed() or \
+                    coop_session.wait_timed_out() or coop_session.remote_left
+        if (keyboard.RETURN or keyboard.KP_ENTER) and can_leave:
+            if coop_session: coop_session.leave_round(coop_session.is_result_confirmed())
             game_state = GAME_STATE_MENU
             if music_on: 
                 try:
@@ -682,6 +1394,8 @@ def on_mouse_down(pos, button):
                         print(f"Erro ao tocar música do menu (de control3s via botão): {e}")
 
 # --- Iniciar Jogo ---
+coop_session = create_coop_session_from_args()
+
 if music_on and MUSIC_MENU:
     try:
         music.play(MUSIC_MENU)